@@ -3,13 +3,24 @@ import sys
 import os
 import json
 import html
-from typing import List, Dict, Tuple, Set
-from fuzzywuzzy import fuzz
-from fuzzywuzzy import process
+import io
+import re
+import functools
+import hashlib
+import heapq
+import sqlite3
+from dataclasses import dataclass
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Dict, Tuple, Set, FrozenSet, Optional
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process
 
 # Import our extractors
 from rym_extractor import extract_rym_data
 from lastfm_extractor import extract_lastfm_albums
+from cli_logging import configure_logging
 
 try:
     from musicbrainz_client import MusicBrainzClient
@@ -17,164 +28,222 @@ try:
 except ImportError:
     MUSICBRAINZ_AVAILABLE = False
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of Last.fm albums scored per batch; bounds the score matrices to
+# MATCH_BATCH_SIZE x len(rym_albums)
+MATCH_BATCH_SIZE = 1024
+
+# Best-match results from earlier runs, keyed by a fingerprint of the RYM data
+MATCH_CACHE_PATH = "data/match_cache.sqlite"
+
+# Part of the fingerprint; bump it when match_batch results change so
+# entries computed by older versions are dropped
+MATCH_CACHE_VERSION = 2
+
+# Common edition/version parentheticals, combined so a title is scanned once
+_EDITION_RE = re.compile(r'''
+    \s*\(
+    (?:
+        [^)]*edition                            # Any "...edition"
+      | remaster(?:ed)? | \d{4}\s*remaster(?:ed)?  # Remasters
+      | deluxe                                  # Deluxe (standalone)
+      | expanded                                # Expanded (standalone)
+      | demos[^)]*                              # Demos (with optional years/info)
+      | explicit                                # Explicit
+    )
+    \)\s*
+''', re.IGNORECASE | re.VERBOSE)
+
+# Common collaboration separators
+_COLLAB_RE = re.compile(r' (?:&|and|feat\.|featuring|ft\.|with|x|vs\.?) |, ', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=None)
 def normalize_string(s: str) -> str:
     """Normalize string for better matching."""
     if not s:
         return ""
-    # Decode HTML entities (&amp; -> &, etc.)
-    s = html.unescape(s)
+    # Decode HTML entities (&amp; -> &, etc.); every entity starts with '&'
+    if '&' in s:
+        s = html.unescape(s)
     # Convert to lowercase, strip whitespace
     return s.lower().strip()
 
+@functools.lru_cache(maxsize=None)
 def normalize_title(title: str) -> str:
     """Normalize album title by removing common edition parentheticals."""
     if not title:
         return ""
     
     # Decode HTML entities first
-    title = html.unescape(title)
+    if '&' in title:
+        title = html.unescape(title)
     
     # Remove only common edition/version parentheticals
-    import re
-    
-    # Separate patterns for readability
-    patterns = [
-        r'\s*\(.*?edition\)\s*',                    # Any "...edition" 
-        r'\s*\((remaster(?:ed)?|\d{4}\s*remaster(?:ed)?)\)\s*',  # Remasters
-        r'\s*\(deluxe\)\s*',                       # Deluxe (standalone)
-        r'\s*\(expanded\)\s*',                     # Expanded (standalone)
-        r'\s*\(demos.*?\)\s*',                     # Demos (with optional years/info)
-        r'\s*\(explicit\)\s*',                     # Explicit
-    ]
-    
-    for pattern in patterns:
-        title = re.sub(pattern, '', title, flags=re.IGNORECASE)
+    title = _EDITION_RE.sub('', title)
     
     return title.strip().lower()
 
+@functools.lru_cache(maxsize=None)
 def extract_main_artist(artist_string: str) -> str:
     """Extract main artist from collaboration strings."""
     if not artist_string:
         return ""
     
-    # Common collaboration patterns
-    separators = [' & ', ' and ', ' feat. ', ' featuring ', ' ft. ', ' with ', ' x ', ' vs. ', ' vs ', ', ']
-    
-    artist_lower = artist_string.lower()
-    for sep in separators:
-        if sep in artist_lower:
-            # Return the first artist (before separator)
-            return artist_string.split(sep)[0].strip()
-    
-    return artist_string.strip()
+    # Return the first artist (before the first separator)
+    return _COLLAB_RE.split(artist_string, maxsplit=1)[0].strip()
 
-def calculate_artist_match_score(lastfm_artist: str, rym_artist: str) -> float:
-    """Calculate artist match score with collaboration handling."""
-    if not lastfm_artist or not rym_artist:
-        return 0.0
+def containment_matrix(needles: List[str], haystacks: List[str]) -> np.ndarray:
+    """Boolean matrix of which needles occur as substrings of which haystacks."""
+    contained = np.zeros((len(needles), len(haystacks)), dtype=bool)
+    if not len(haystacks):
+        return contained
+    
+    # One substring search per needle over all haystacks joined together;
+    # needles never contain the separator, so hits can't straddle two haystacks
+    joined = '\0'.join(haystacks)
+    ends = list(accumulate(len(h) + 1 for h in haystacks))
+    for i, needle in enumerate(needles):
+        if not needle:
+            continue
+        row = contained[i]
+        find = joined.find
+        pos = find(needle)
+        while pos != -1:
+            j = bisect_right(ends, pos)
+            row[j] = True
+            pos = find(needle, ends[j])
+    
+    return contained
+
+def artist_score_matrix(lastfm_artists: List[str], rym_artists: List[str]) -> np.ndarray:
+    """
+    Score every Last.fm/RYM artist pair at once.
     
-    # Direct fuzzy match
-    direct_score = fuzz.ratio(lastfm_artist, rym_artist)
+    Each score is the best of the direct ratio, the ratio of the main
+    artists (before any collaboration separator), and 85 when either
+    non-empty main artist is contained in the other full artist string.
+    """
+    lastfm_mains = [extract_main_artist(a) for a in lastfm_artists]
+    rym_mains = [extract_main_artist(a) for a in rym_artists]
     
-    # Extract main artists and compare
-    lastfm_main = extract_main_artist(lastfm_artist)
-    rym_main = extract_main_artist(rym_artist)
-    main_score = fuzz.ratio(lastfm_main, rym_main)
+    scores = process.cdist(lastfm_artists, rym_artists, scorer=fuzz.ratio, dtype=np.uint8, workers=-1)
+    np.maximum(scores, process.cdist(lastfm_mains, rym_mains, scorer=fuzz.ratio, dtype=np.uint8, workers=-1), out=scores)
     
     # Check if one artist is contained in the other (for collaborations)
-    containment_score = 0
-    if lastfm_main in rym_artist or rym_main in lastfm_artist:
-        containment_score = 85  # High score for containment
+    contained = containment_matrix(lastfm_mains, rym_artists)
+    contained |= containment_matrix(rym_mains, lastfm_artists).T
+    scores[contained] = np.maximum(scores[contained], 85)
     
-    # Return the best score
-    return max(direct_score, main_score, containment_score)
+    return scores
 
-def load_blacklist(blacklist_path: str = "data/blacklist.json") -> List[Dict]:
-    """Load blacklist of albums to exclude from recommendations."""
+def load_blacklist(blacklist_path: str = "data/blacklist.json") -> FrozenSet[Tuple[str, str]]:
+    """Load blacklist of albums to exclude from recommendations as normalized (artist, title) keys."""
     if not os.path.exists(blacklist_path):
-        return []
+        return frozenset()
     
     try:
-        with open(blacklist_path, 'r', encoding='utf-8') as f:
-            blacklist = json.load(f)
+        if orjson:
+            with open(blacklist_path, 'rb') as f:
+                blacklist = orjson.loads(f.read())
+        else:
+            with open(blacklist_path, 'r', encoding='utf-8') as f:
+                blacklist = json.load(f)
         print(f"Loaded {len(blacklist)} blacklisted albums")
-        return blacklist
+        return frozenset((normalize_string(blocked.get('artist', '')), normalize_title(blocked.get('title', '')))
+                         for blocked in blacklist)
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
     except (json.JSONDecodeError, FileNotFoundError):
         print(f"Could not load blacklist from {blacklist_path}")
-        return []
+        return frozenset()
 
-def is_blacklisted(album: Dict, blacklist: List[Dict]) -> bool:
+def is_blacklisted(album: Dict, blacklist: FrozenSet[Tuple[str, str]]) -> bool:
     """Check if an album matches any blacklist entry."""
-    album_artist = normalize_string(album['artist'])
-    album_title = normalize_title(album['title'])
-    
-    for blocked in blacklist:
-        blocked_artist = normalize_string(blocked.get('artist', ''))
-        blocked_title = normalize_title(blocked.get('title', ''))
-        
-        if album_artist == blocked_artist and album_title == blocked_title:
-            return True
+    return (normalize_string(album['artist']), normalize_title(album['title'])) in blacklist
+
+def write_debug_file(path: str, buffer: io.StringIO) -> None:
+    """Write buffered debug output to disk in a single call."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(buffer.getvalue())
+
+def release_type_rules(filter_config: Dict) -> Tuple[FrozenSet[str], Tuple[str, ...]]:
+    """
+    Resolve filter preferences once into the rules applied to every album.
     
-    return False
+    Returns the lowercased primary types to filter out and the keywords that
+    filter an album out when found in any of its lowercased secondary types.
+    """
+    primary_types = set()
+    if filter_config.get('filter_singles', True):
+        primary_types.add('single')
+    if filter_config.get('filter_eps', False):
+        primary_types.add('ep')
+    
+    secondary_keywords = []
+    if filter_config.get('filter_compilations', True):
+        secondary_keywords.append('compilation')
+    if filter_config.get('filter_live', False):
+        secondary_keywords.append('live')
+    if filter_config.get('filter_demos', True):
+        secondary_keywords.append('demo')
+    if filter_config.get('filter_mixtapes', True):
+        secondary_keywords.extend(('mixtape', 'street'))
+    
+    return frozenset(primary_types), tuple(secondary_keywords)
 
-def should_filter_by_release_type(album: Dict, filter_config: Dict) -> bool:
-    """Check if an album should be filtered out based on release type."""
+def matches_release_type_rules(album: Dict, primary_types: FrozenSet[str],
+                               secondary_keywords: Tuple[str, ...]) -> bool:
+    """Check an album against rules from release_type_rules."""
     primary_type = album.get('mb_primary_type')
-    secondary_types = album.get('mb_secondary_types', [])
-    confidence = album.get('mb_confidence', 0.0)
     
     # If no MusicBrainz data or low confidence, don't filter
-    if not primary_type or confidence < 0.7:
+    if not primary_type or album.get('mb_confidence', 0.0) < 0.7:
         return False
     
-    # Filter singles if requested
-    if filter_config.get('filter_singles', True) and primary_type and primary_type.lower() == 'single':
-        return True
-    
-    # Filter EPs if requested
-    if filter_config.get('filter_eps', False) and primary_type and primary_type.lower() == 'ep':
+    if primary_type.lower() in primary_types:
         return True
     
-    # Filter compilations if requested (check secondary types case-insensitively)
-    if filter_config.get('filter_compilations', True) and secondary_types:
-        if any('compilation' in sec_type.lower() for sec_type in secondary_types):
-            return True
-    
-    # Filter live albums if requested
-    if filter_config.get('filter_live', False) and secondary_types:
-        if any('live' in sec_type.lower() for sec_type in secondary_types):
-            return True
-    
-    # Filter demos if requested
-    if filter_config.get('filter_demos', True) and secondary_types:
-        if any('demo' in sec_type.lower() for sec_type in secondary_types):
-            return True
-    
-    # Filter mixtapes if requested
-    if filter_config.get('filter_mixtapes', True) and secondary_types:
-        if any('mixtape' in sec_type.lower() or 'street' in sec_type.lower() for sec_type in secondary_types):
-            return True
+    # Keywords match as substrings (e.g. 'street' in 'Mixtape/Street'); joining
+    # the types lowercases them all at once without letting a match span two
+    secondary_types = album.get('mb_secondary_types')
+    if secondary_types and secondary_keywords:
+        secondary = '\n'.join(secondary_types).lower()
+        return any(keyword in secondary for keyword in secondary_keywords)
     
     return False
 
-def filter_albums_by_type(albums: List[Dict], filter_config: Dict, debug: bool = False) -> List[Dict]:
-    """Filter albums based on release type preferences."""
-    if not filter_config:
+def filter_albums_by_type(albums: List[Dict], filter_config: Optional[Dict], debug: bool = False,
+                          blacklist: FrozenSet[Tuple[str, str]] = frozenset()) -> List[Dict]:
+    """Filter albums based on release type preferences, dropping blacklisted albums in the same pass."""
+    if not filter_config and not blacklist:
         return albums
     
     filtered = []
     filtered_count = 0
+    blacklisted_count = 0
     
-    # Open debug file for filtering if debug mode enabled
+    # Buffer debug output for filtering in memory if debug mode enabled
     debug_file = None
-    if debug:
-        os.makedirs('data', exist_ok=True)
-        debug_file = open('data/debug_filtering.txt', 'w', encoding='utf-8')
+    if debug and filter_config:
+        debug_file = io.StringIO()
         debug_file.write("MUSICBRAINZ FILTERING DEBUG OUTPUT\n")
         debug_file.write("=" * 60 + "\n\n")
     
+    # Resolve the filter preferences once rather than per album
+    if filter_config:
+        primary_types, secondary_keywords = release_type_rules(filter_config)
+    
     for album in albums:
-        should_filter = should_filter_by_release_type(album, filter_config)
+        if blacklist and is_blacklisted(album, blacklist):
+            blacklisted_count += 1
+            continue
+        
+        should_filter = bool(filter_config) and matches_release_type_rules(
+            album, primary_types, secondary_keywords)
         
         if debug and debug_file:
             debug_file.write(f"ALBUM: {album['artist']} - {album['title']}\n")
@@ -207,17 +276,214 @@ def filter_albums_by_type(albums: List[Dict], filter_config: Dict, debug: bool =
             filtered.append(album)
     
     if debug_file:
-        debug_file.close()
+        write_debug_file('data/debug_filtering.txt', debug_file)
         print(f"MusicBrainz filtering debug written to data/debug_filtering.txt")
     
+    if blacklisted_count > 0:
+        print(f"Filtered out {blacklisted_count} blacklisted albums")
+    
     if filtered_count > 0:
         print(f"Filtered out {filtered_count} albums by release type")
     
     return filtered
 
 
+@dataclass
+class AlbumTable:
+    """Albums laid out as columns of normalized match keys."""
+    albums: List[Dict]
+    positions: List[int]  # Index of each row in the list it was built from
+    artist: np.ndarray
+    artist_localized: np.ndarray
+    title: np.ndarray
+    
+    @classmethod
+    def from_albums(cls, albums: List[Dict]) -> 'AlbumTable':
+        """Normalize albums once, skipping any without an artist or title."""
+        kept = []
+        positions = []
+        artists = []
+        artists_loc = []
+        titles = []
+        for i, album in enumerate(albums):
+            artist = normalize_string(album['artist'])
+            title = normalize_title(album['title'])
+            if not artist or not title:
+                continue
+            kept.append(album)
+            positions.append(i)
+            artists.append(artist)
+            # Only keep a localized name that differs, so it isn't scored twice
+            artist_loc = normalize_string(album.get('artist_localized', ''))
+            artists_loc.append(artist_loc if artist_loc != artist else '')
+            titles.append(title)
+        
+        return cls(kept, positions, np.array(artists, dtype=object),
+                   np.array(artists_loc, dtype=object), np.array(titles, dtype=object))
+    
+    def __len__(self) -> int:
+        return len(self.albums)
+    
+    def __getitem__(self, rows: slice) -> 'AlbumTable':
+        return AlbumTable(self.albums[rows], self.positions[rows], self.artist[rows],
+                          self.artist_localized[rows], self.title[rows])
+    
+    def take(self, rows: List[int]) -> 'AlbumTable':
+        """Select rows by index."""
+        return AlbumTable([self.albums[i] for i in rows], [self.positions[i] for i in rows],
+                          self.artist[rows], self.artist_localized[rows], self.title[rows])
+    
+    def unique(self) -> Tuple['AlbumTable', List[int]]:
+        """
+        Collapse rows with identical match keys.
+        
+        Returns the table of first occurrences and, for every row, the index
+        of its key in that table.
+        """
+        index = {}
+        first_rows = []
+        inverse = []
+        for row, key in enumerate(zip(self.artist, self.artist_localized, self.title)):
+            if key not in index:
+                index[key] = len(first_rows)
+                first_rows.append(row)
+            inverse.append(index[key])
+        return self.take(first_rows), inverse
+
+# Best RYM candidate for one Last.fm album: (rym_row, is_match, artist_score, title_score, combined_score)
+MatchResult = Optional[Tuple[int, bool, float, float, float]]
+
+def match_result(rym_row: int, is_match: bool, artist_score: float, title_score: float) -> MatchResult:
+    """Build a MatchResult, combining the scores as 0.6 * artist + 0.4 * title."""
+    artist_score = float(artist_score)
+    title_score = float(title_score)
+    return (int(rym_row), is_match, artist_score, title_score, artist_score * 0.6 + title_score * 0.4)
+
+def match_batch(lastfm: AlbumTable, rym: AlbumTable, artist_threshold: int, title_threshold: int,
+                include_attempts: bool = True) -> List[MatchResult]:
+    """
+    Find the best RYM candidate for each album in a batch of Last.fm albums.
+    
+    Returns one entry per Last.fm album: None if nothing scored above zero,
+    otherwise (rym_row, is_match, artist_score, title_score, combined_score).
+    When is_match is False the entry describes the best attempt rather than
+    a match; best attempts are left out (None) unless include_attempts is set.
+    
+    A best attempt depends only on its own album, never on the rest of the
+    batch: it is the highest scoring RYM album whose artist reaches the
+    threshold, or failing that the best title among the closest artists.
+    """
+    results = [None] * len(lastfm)
+    if not len(lastfm) or not len(rym):
+        return results
+    
+    # Try matching with both regular and localized artist names
+    artist_scores = artist_score_matrix(lastfm.artist, rym.artist)
+    loc_cols = np.flatnonzero(rym.artist_localized != '')
+    if len(loc_cols):
+        loc_scores = artist_score_matrix(lastfm.artist, rym.artist_localized[loc_cols])
+        artist_scores[:, loc_cols] = np.maximum(artist_scores[:, loc_cols], loc_scores)
+    
+    # Blocking: RYM albums whose artist can't reach the threshold for any
+    # Last.fm album can never match, so their titles are not scored at all
+    reachable = artist_scores >= artist_threshold
+    block = np.flatnonzero(reachable.any(axis=0))
+    if len(block):
+        block_artist_scores = artist_scores[:, block]
+        block_reachable = reachable[:, block]
+        title_scores = process.cdist(lastfm.title, rym.title[block],
+                                     scorer=fuzz.ratio, dtype=np.uint8, workers=-1)
+        
+        # Combined score is the weighted average 0.6 * artist + 0.4 * title. Rank
+        # candidates by the exact integer 3 * artist + 2 * title (five times the
+        # combined score) so the whole selection stays in small integer arrays.
+        weighted = np.multiply(block_artist_scores, 3, dtype=np.int16)
+        weighted += np.multiply(title_scores, 2, dtype=np.int16)
+        
+        # Tiered thresholds: if artist match is perfect, be more lenient on title
+        title_min = np.where(block_artist_scores >= 95, np.uint8(60), np.uint8(title_threshold))
+        passing = block_reachable & (title_scores >= title_min)
+        
+        if include_attempts:
+            # Only the album's own reachable candidates, so the attempt doesn't
+            # depend on which other albums brought columns into the block
+            best_attempts = np.where(block_reachable, weighted, -1).argmax(axis=1)
+        np.putmask(weighted, ~passing, -1)
+        best_matches = weighted.argmax(axis=1)
+        
+        for row in range(len(lastfm)):
+            col = best_matches[row]
+            is_match = bool(passing[row, col])
+            if not is_match:
+                if not include_attempts or not block_reachable[row, best_attempts[row]]:
+                    continue
+                col = best_attempts[row]
+            results[row] = match_result(block[col], is_match, block_artist_scores[row, col],
+                                        title_scores[row, col])
+    
+    if include_attempts:
+        # Albums whose artist reaches no RYM album: best title among the closest artists
+        for row in np.flatnonzero(~reachable.any(axis=1)):
+            top_artist_score = artist_scores[row].max()
+            cols = np.flatnonzero(artist_scores[row] == top_artist_score)
+            row_titles = process.cdist([lastfm.title[row]], rym.title[cols],
+                                       scorer=fuzz.ratio, dtype=np.uint8)[0]
+            best = row_titles.argmax()
+            if top_artist_score or row_titles[best]:
+                results[row] = match_result(cols[best], False, top_artist_score, row_titles[best])
+    
+    return results
+
+def match_fingerprint(rym: AlbumTable, artist_threshold: int, title_threshold: int) -> str:
+    """Hash the RYM match keys, thresholds and cache version that cached results depend on."""
+    payload = json.dumps([MATCH_CACHE_VERSION, artist_threshold, title_threshold,
+                          list(zip(rym.artist, rym.artist_localized, rym.title))])
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def match_cache_key(lastfm: AlbumTable, row: int) -> str:
+    """Cache key for a Last.fm row: its normalized artist and title."""
+    return f"{lastfm.artist[row]}\x1f{lastfm.title[row]}"
+
+def open_match_cache(cache_path: str) -> Optional[sqlite3.Connection]:
+    """Open the match cache, creating it if needed. Returns None if unavailable."""
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(cache_path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS matches (
+                            rym_hash TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            match_json TEXT,
+                            PRIMARY KEY (rym_hash, key))""")
+        return conn
+    except sqlite3.Error as e:
+        print(f"Warning: Could not open match cache: {e}")
+        return None
+
+def load_cached_matches(conn: sqlite3.Connection, fingerprint: str) -> Dict[str, MatchResult]:
+    """Load every cached result computed against the given RYM data."""
+    cached = {}
+    for key, match_json in conn.execute(
+            "SELECT key, match_json FROM matches WHERE rym_hash = ?", (fingerprint,)):
+        cached[key] = tuple(json.loads(match_json)) if match_json else None
+    return cached
+
+def save_cached_matches(conn: sqlite3.Connection, fingerprint: str,
+                        entries: List[Tuple[str, MatchResult]]) -> None:
+    """Store new results, dropping those computed against older RYM data."""
+    try:
+        with conn:
+            conn.execute("DELETE FROM matches WHERE rym_hash != ?", (fingerprint,))
+            for start in range(0, len(entries), 1000):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO matches (rym_hash, key, match_json) VALUES (?, ?, ?)",
+                    [(fingerprint, key, json.dumps(result) if result else None)
+                     for key, result in entries[start:start + 1000]])
+    except sqlite3.Error as e:
+        print(f"Warning: Could not save match cache: {e}")
+
 def fuzzy_match_albums(rym_albums: List[Dict], lastfm_albums: List[Dict], 
-                      artist_threshold: int = 85, title_threshold: int = 85, debug: bool = False) -> Tuple[List[Dict], List[Dict]]:
+                      artist_threshold: int = 85, title_threshold: int = 85, debug: bool = False,
+                      cache_path: Optional[str] = MATCH_CACHE_PATH) -> Tuple[List[Dict], List[Dict]]:
     """
     Find Last.fm albums that aren't rated on RYM.
     
@@ -226,27 +492,67 @@ def fuzzy_match_albums(rym_albums: List[Dict], lastfm_albums: List[Dict],
         lastfm_albums: List of Last.fm albums with scrobbles
         artist_threshold: Minimum fuzzy match score for artist names
         title_threshold: Minimum fuzzy match score for album titles
+        cache_path: SQLite file for results reused across runs (None disables it)
     
     Returns:
-        Tuple of (matched_albums, unrated_albums)
+        Tuple of (matched_albums, unrated_albums). These are the Last.fm album
+        dicts themselves, updated in place with the RYM match details.
     """
     matched_albums = []
     unrated_albums = []
     
     print(f"Matching {len(lastfm_albums)} Last.fm albums against {len(rym_albums)} RYM albums...")
     
-    # Open debug file if debug mode is enabled
+    # Buffer debug output in memory if debug mode is enabled
     debug_file = None
     if debug:
-        os.makedirs('data', exist_ok=True)
-        debug_file = open('data/debug_output.txt', 'w', encoding='utf-8')
+        debug_file = io.StringIO()
         debug_file.write("ALBUM MATCHER DEBUG OUTPUT\n")
         debug_file.write("=" * 60 + "\n\n")
     
-    for lastfm_album in lastfm_albums:
-        lastfm_artist = normalize_string(lastfm_album['artist'])
-        lastfm_title = normalize_title(lastfm_album['title'])
-        
+    # Normalize both sides once up front, scoring each distinct key only once.
+    # Duplicate RYM keys would score identically and never win the argmax.
+    rym, _ = AlbumTable.from_albums(rym_albums).unique()
+    lastfm_table = AlbumTable.from_albums(lastfm_albums)
+    lastfm, lastfm_inverse = lastfm_table.unique()
+    
+    # Row of each Last.fm album in the deduplicated table (None if it can't be matched)
+    lastfm_rows = [None] * len(lastfm_albums)
+    for position, row in zip(lastfm_table.positions, lastfm_inverse):
+        lastfm_rows[position] = row
+    
+    # Reuse results from earlier runs against the same RYM data
+    results = [None] * len(lastfm)
+    pending = list(range(len(lastfm)))
+    conn = open_match_cache(cache_path) if cache_path else None
+    if conn:
+        fingerprint = match_fingerprint(rym, artist_threshold, title_threshold)
+        cached = load_cached_matches(conn, fingerprint)
+        pending = []
+        for row in range(len(lastfm)):
+            key = match_cache_key(lastfm, row)
+            if key in cached:
+                results[row] = cached[key]
+            else:
+                pending.append(row)
+        print(f"Reused {len(lastfm) - len(pending)} cached matches")
+    
+    # Score the remaining Last.fm albums in batches to bound the size of the
+    # score matrices. Best attempts are kept when caching so debug runs can use them.
+    to_score = lastfm.take(pending)
+    for start in range(0, len(to_score), MATCH_BATCH_SIZE):
+        batch = match_batch(to_score[start:start + MATCH_BATCH_SIZE], rym, artist_threshold,
+                            title_threshold, include_attempts=debug or conn is not None)
+        for row, result in zip(pending[start:start + MATCH_BATCH_SIZE], batch):
+            results[row] = result
+    
+    if conn:
+        if pending:
+            save_cached_matches(conn, fingerprint,
+                                [(match_cache_key(lastfm, row), results[row]) for row in pending])
+        conn.close()
+    
+    for lastfm_album, row in zip(lastfm_albums, lastfm_rows):
         if debug and debug_file:
             debug_file.write(f"ALBUM: {lastfm_album['artist']} - {lastfm_album['title']}\n")
             debug_file.write(f"Scrobbles: {lastfm_album.get('scrobbles', 'N/A')}\n")
@@ -265,78 +571,40 @@ def fuzzy_match_albums(rym_albums: List[Dict], lastfm_albums: List[Dict],
             else:
                 debug_file.write("MusicBrainz: Not enriched\n")
         
-        if not lastfm_artist or not lastfm_title:
+        if row is None:
             if debug and debug_file:
                 debug_file.write("SKIPPED: Missing artist or title\n\n")
             continue
-            
+        
         best_match = None
-        best_score = 0
         best_match_info = None
-        
-        for rym_album in rym_albums:
-            rym_artist = normalize_string(rym_album['artist'])
-            rym_artist_loc = normalize_string(rym_album.get('artist_localized', ''))
-            rym_title = normalize_title(rym_album['title'])
-            
-            if not rym_artist or not rym_title:
-                continue
-            
-            # Try matching with both regular and localized artist names
-            artist_scores = []
-            if rym_artist:
-                artist_scores.append(calculate_artist_match_score(lastfm_artist, rym_artist))
-            if rym_artist_loc:
-                artist_scores.append(calculate_artist_match_score(lastfm_artist, rym_artist_loc))
-            
-            if not artist_scores:
-                continue
-                
-            best_artist_score = max(artist_scores)
-            title_score = fuzz.ratio(lastfm_title, rym_title)
-            
-            # Combined score (weighted average)
-            combined_score = (best_artist_score * 0.6 + title_score * 0.4)
-            
-            if combined_score > best_score:
-                best_score = combined_score
+        if results[row]:
+            col, is_match, artist_score, title_score, combined_score = results[row]
+            if is_match:
+                best_match = rym.albums[col]
+            # Score details are only reported in debug mode
+            if debug:
                 best_match_info = {
-                    'rym_artist': rym_album['artist'],
-                    'rym_title': rym_album['title'], 
-                    'artist_score': best_artist_score,
+                    'rym_artist': rym.albums[col]['artist'],
+                    'rym_title': rym.albums[col]['title'], 
+                    'artist_score': artist_score,
                     'title_score': title_score,
                     'combined_score': combined_score
                 }
-                
-                # Tiered thresholds: if artist match is perfect, be more lenient on title
-                if best_artist_score >= 95:  # Near-perfect artist match
-                    title_min = 60
-                elif best_artist_score >= artist_threshold:  # Good artist match
-                    title_min = title_threshold
-                else:
-                    title_min = 100  # Impossible - require perfect artist match
-                
-                if (best_artist_score >= artist_threshold and 
-                    title_score >= title_min):
-                    best_match = rym_album
         
         if best_match:
             if debug and debug_file:
                 debug_file.write(f"MATCHED with RYM: {best_match['artist']} - {best_match['title']}\n")
                 debug_file.write(f"RYM Rating: {best_match['rating']}/10\n")
-                if best_match_info:
-                    debug_file.write(f"Match Scores - Artist: {best_match_info['artist_score']:.1f}, Title: {best_match_info['title_score']:.1f}, Combined: {best_match_info['combined_score']:.1f}\n")
+                debug_file.write(f"Match Scores - Artist: {best_match_info['artist_score']:.1f}, Title: {best_match_info['title_score']:.1f}, Combined: {best_match_info['combined_score']:.1f}\n")
                 debug_file.write("STATUS: Will not appear in recommendations (already rated)\n\n")
             
-            matched_info = {
-                **lastfm_album,
-                'rym_rating': best_match['rating'],
-                'rym_artist': best_match['artist'],
-                'rym_artist_localized': best_match.get('artist_localized', ''),
-                'rym_title': best_match['title'],
-                'match_score': best_score
-            }
-            matched_albums.append(matched_info)
+            lastfm_album['rym_rating'] = best_match['rating']
+            lastfm_album['rym_artist'] = best_match['artist']
+            lastfm_album['rym_artist_localized'] = best_match.get('artist_localized', '')
+            lastfm_album['rym_title'] = best_match['title']
+            lastfm_album['match_score'] = combined_score
+            matched_albums.append(lastfm_album)
         else:
             if debug and debug_file:
                 debug_file.write("NO RYM MATCH found\n")
@@ -346,15 +614,12 @@ def fuzzy_match_albums(rym_albums: List[Dict], lastfm_albums: List[Dict],
                 debug_file.write("STATUS: Will appear in recommendations\n\n")
             
             # Add debugging info about best match attempt
-            unrated_info = {
-                **lastfm_album,
-                'best_match': best_match_info
-            }
-            unrated_albums.append(unrated_info)
+            lastfm_album['best_match'] = best_match_info
+            unrated_albums.append(lastfm_album)
     
-    # Close debug file if open
+    # Write out buffered debug output
     if debug_file:
-        debug_file.close()
+        write_debug_file('data/debug_output.txt', debug_file)
         print(f"Debug information written to data/debug_output.txt")
     
     return matched_albums, unrated_albums
@@ -379,8 +644,11 @@ def main():
                        help='Also filter out live albums (requires --use-musicbrainz)')
     parser.add_argument('--debug', action='store_true',
                        help='Write extended debug information to data/debug_output.txt')
+    parser.add_argument('--no-match-cache', action='store_true',
+                       help='Rescore every album instead of reusing cached matches')
     
     args = parser.parse_args()
+    configure_logging()
     
     rym_csv_path = args.rym_csv
     lastfm_username = args.lastfm_username
@@ -430,17 +698,8 @@ def main():
                                           enrich_with_musicbrainz=use_musicbrainz)
     print(f"Found {len(lastfm_albums)} albums on Last.fm")
     
-    # Filter out blacklisted albums
-    if blacklist:
-        original_count = len(lastfm_albums)
-        lastfm_albums = [album for album in lastfm_albums if not is_blacklisted(album, blacklist)]
-        filtered_count = original_count - len(lastfm_albums)
-        if filtered_count > 0:
-            print(f"Filtered out {filtered_count} blacklisted albums")
-    
-    # Filter by release type if MusicBrainz data is available
-    if use_musicbrainz and filter_config:
-        lastfm_albums = filter_albums_by_type(lastfm_albums, filter_config, debug=args.debug)
+    # Filter out blacklisted albums, and by release type if MusicBrainz data is available
+    lastfm_albums = filter_albums_by_type(lastfm_albums, filter_config, debug=args.debug, blacklist=blacklist)
     
     if not rym_albums or not lastfm_albums:
         print("Error: No data to compare")
@@ -448,7 +707,8 @@ def main():
     
     # Perform fuzzy matching
     print(f"\n4. Performing fuzzy matching...")
-    matched_albums, unrated_albums = fuzzy_match_albums(rym_albums, lastfm_albums, debug=args.debug)
+    matched_albums, unrated_albums = fuzzy_match_albums(rym_albums, lastfm_albums, debug=args.debug,
+                                                        cache_path=None if args.no_match_cache else MATCH_CACHE_PATH)
     
     # Display results
     print(f"\n" + "=" * 60)
@@ -463,23 +723,24 @@ def main():
         print(f"\n ALBUMS TO RATE ({len(unrated_albums)}):")
         print("-" * 60)
         
-        # Sort by scrobbles (descending)
-        unrated_sorted = sorted(unrated_albums, 
-                               key=lambda x: int(x.get('scrobbles', 0)), 
-                               reverse=True)
+        # Top 20 by scrobbles (descending); same order as a full stable sort
+        top_unrated = heapq.nlargest(20, unrated_albums, key=lambda x: int(x.get('scrobbles', 0)))
         
-        for album in unrated_sorted[:20]:  # Show top 20
-            print(f"{album['scrobbles']} scrobbles")
-            print(f"   {album['artist']} - {album['title']}")
+        # Build the listing up front and write it in one go
+        lines = []
+        for album in top_unrated:
+            lines.append(f"{album['scrobbles']} scrobbles")
+            lines.append(f"   {album['artist']} - {album['title']}")
             
             # Only show match scores in debug mode
             if args.debug and album.get('best_match'):
                 best = album['best_match']
-                print(f"   Best match: {best['rym_artist']} - {best['rym_title']}")
-                print(f"   Scores: Artist {best['artist_score']:.1f} | Title {best['title_score']:.1f} | Combined {best['combined_score']:.1f}")
+                lines.append(f"   Best match: {best['rym_artist']} - {best['rym_title']}")
+                lines.append(f"   Scores: Artist {best['artist_score']:.1f} | Title {best['title_score']:.1f} | Combined {best['combined_score']:.1f}")
             elif args.debug and not album.get('best_match'):
-                print(f"   No potential matches found")
-            print()
+                lines.append(f"   No potential matches found")
+            lines.append("")
+        sys.stdout.write('\n'.join(lines) + '\n')
     
     # if matched_albums:
     #     print(f"\nSAMPLE MATCHED ALBUMS ({min(10, len(matched_albums))}):")
@@ -0,0 +1,11 @@
+import logging
+import os
+
+def configure_logging() -> None:
+    """Set up logging for a command-line run at the level named by LOGLEVEL (default WARNING)."""
+    level_name = os.getenv('LOGLEVEL', 'WARNING').upper()
+    # getLevelName maps a known name to its number and anything else to a string
+    level = logging.getLevelName(level_name)
+    logging.basicConfig(level=level if isinstance(level, int) else logging.WARNING, format='%(message)s')
+    if not isinstance(level, int):
+        logging.getLogger(__name__).warning("Ignoring unknown LOGLEVEL=%r, using WARNING", level_name)
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
 import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from cli_logging import configure_logging
+
+log = logging.getLogger(__name__)
 
 try:
     from musicbrainz_client import MusicBrainzClient
@@ -12,27 +20,66 @@ try:
 except ImportError:
     MUSICBRAINZ_AVAILABLE = False
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
+LASTFM_PAGE_SIZE = 200  # Max allowed per page
+LASTFM_PAGE_WORKERS = 4  # Pages fetched at once
+
+# Seconds before cached Last.fm data is considered stale and fetched again
+LASTFM_CACHE_TTL = 86400
+try:
+    LASTFM_CACHE_TTL = int(os.getenv('LASTFM_CACHE_TTL', LASTFM_CACHE_TTL))
+except ValueError:
+    log.warning("Ignoring LASTFM_CACHE_TTL=%r, not a whole number of seconds", os.getenv('LASTFM_CACHE_TTL'))
+
+# Shared session so paginated requests reuse one pooled connection, with
+# retries (and backoff) for rate limiting and transient server errors
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4, pool_maxsize=8,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])))
+
 def get_cache_filename(username: str, period: str, limit: int, with_musicbrainz: bool = False) -> str:
     """Generate cache filename based on parameters."""
     mb_suffix = "_mb" if with_musicbrainz else ""
     return f"data/lastfm_{username}_{period}_{limit}{mb_suffix}.json"
 
-def load_cached_data(cache_file: str) -> Optional[List[Dict[str, str]]]:
-    """Load cached data if it exists."""
+def load_cached_data(cache_file: str) -> Tuple[Optional[List[Dict[str, str]]], bool]:
+    """
+    Load cached data if it exists.
+    
+    Returns the cached albums (None if there are none) and whether they are
+    older than LASTFM_CACHE_TTL. Stale albums are kept as a fallback in case
+    fetching fresh data fails.
+    """
     if not os.path.exists(cache_file):
-        return None
+        return None, False
     
     try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cached = json.load(f)
+        with open(cache_file, 'rb') as f:
+            raw = f.read()
+        cached = orjson.loads(raw) if orjson else json.loads(raw)
+        
+        # Older caches store an ISO timestamp rather than epoch seconds
+        timestamp = cached['timestamp']
+        if isinstance(timestamp, str):
+            cached_time = datetime.fromisoformat(timestamp)
+        else:
+            cached_time = datetime.fromtimestamp(timestamp)
         
-        cached_time = datetime.fromisoformat(cached['timestamp'])
+        if (datetime.now() - cached_time).total_seconds() > LASTFM_CACHE_TTL:
+            print(f"Cached data from {cached_time.strftime('%Y-%m-%d %H:%M')} is stale, fetching fresh data...")
+            return cached['albums'], True
         print(f"Using cached data from {cached_time.strftime('%Y-%m-%d %H:%M')}")
-        return cached['albums']
+        return cached['albums'], False
             
-    except (json.JSONDecodeError, KeyError, ValueError):
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
         print("Cache file corrupted, fetching fresh data...")
-        return None
+        return None, False
 
 def save_to_cache(albums: List[Dict[str, str]], cache_file: str):
     """Save albums data to cache with timestamp."""
@@ -40,15 +87,32 @@ def save_to_cache(albums: List[Dict[str, str]], cache_file: str):
     os.makedirs('data', exist_ok=True)
     
     cache_data = {
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': int(time.time()),
         'albums': albums
     }
     
-    with open(cache_file, 'w', encoding='utf-8') as f:
-        json.dump(cache_data, f, indent=2, ensure_ascii=False)
+    # Compact output; orjson is used when installed
+    if orjson:
+        payload = orjson.dumps(cache_data)
+    else:
+        payload = json.dumps(cache_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    # Write to a temporary file and swap it in, so an interrupted write never
+    # leaves a truncated cache behind
+    tmp_file = f"{cache_file}.tmp.{os.getpid()}"
+    with open(tmp_file, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, cache_file)
     
     print(f"Saved {len(albums)} albums to cache: {cache_file}")
 
+def _musicbrainz_lookup_args(album: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """Keyword arguments for MusicBrainzClient.get_release_type for an album."""
+    mbid = album.get('mbid', '').strip()
+    return {'mbid': mbid if mbid else None, 'artist': album.get('artist', ''), 'album': album.get('title', '')}
+
 def enrich_albums_with_musicbrainz(albums: List[Dict[str, str]]) -> List[Dict[str, str]]:
     """Enrich album data with MusicBrainz release type information."""
     if not MUSICBRAINZ_AVAILABLE:
@@ -60,24 +124,42 @@ def enrich_albums_with_musicbrainz(albums: List[Dict[str, str]]) -> List[Dict[st
     mb_client = MusicBrainzClient()
     enriched_albums = []
     
-    for i, album in enumerate(albums):
-        if i % 10 == 0:
-            print(f"Processing album {i+1}/{len(albums)}...")
-        
+    # Look up each distinct album once, by MBID or else by case-insensitive name
+    lookup_index = {}
+    lookup_albums = []
+    album_lookups = []
+    for album in albums:
+        key = (album.get('mbid', '').strip()
+               or (album.get('artist', '').lower().strip(), album.get('title', '').lower().strip()))
+        if key not in lookup_index:
+            lookup_index[key] = len(lookup_albums)
+            lookup_albums.append(album)
+        album_lookups.append(lookup_index[key])
+    
+    # Answer everything the cache already knows before making any requests
+    mb_results = [mb_client.get_release_type_cached_only(**_musicbrainz_lookup_args(album))
+                  for album in lookup_albums]
+    uncached = [i for i, mb_data in enumerate(mb_results) if mb_data is None]
+    print(f"Found {len(lookup_albums) - len(uncached)} albums in cache, {len(uncached)} to fetch")
+    
+    # Albums without an MBID are looked up by search; resolve as many of
+    # those as possible with batched queries before the per-album loop
+    search_pairs = [(lookup_albums[i].get('artist', ''), lookup_albums[i].get('title', ''))
+                    for i in uncached if not lookup_albums[i].get('mbid', '').strip()]
+    if search_pairs:
+        resolved = mb_client.prefetch_searches(search_pairs)
+        print(f"Resolved {resolved} album searches with batched queries")
+    
+    for n, i in enumerate(uncached):
+        if n % 10 == 0:
+            print(f"Fetching album {n+1}/{len(uncached)}...")
+        mb_results[i] = mb_client.get_release_type(**_musicbrainz_lookup_args(lookup_albums[i]))
+    
+    for album, lookup in zip(albums, album_lookups):
+        mb_data = mb_results[lookup]
         # Create enriched album dict
         enriched_album = album.copy()
         
-        # Try to get MusicBrainz release type
-        mbid = album.get('mbid', '').strip()
-        artist = album.get('artist', '')
-        title = album.get('title', '')
-        
-        mb_data = mb_client.get_release_type(
-            mbid=mbid if mbid else None,
-            artist=artist,
-            album=title
-        )
-        
         if mb_data:
             enriched_album.update({
                 'mb_primary_type': mb_data.get('primary_type'),
@@ -98,6 +180,41 @@ def enrich_albums_with_musicbrainz(albums: List[Dict[str, str]]) -> List[Dict[st
     print(f"MusicBrainz enrichment complete!")
     return enriched_albums
 
+def fetch_top_albums_page(base_params: Dict[str, str], page: int) -> Dict:
+    """Fetch one full page of a user's top albums."""
+    params = {**base_params, 'limit': LASTFM_PAGE_SIZE, 'page': page}
+    response = _SESSION.get(LASTFM_API_URL, params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+def parse_album_list(album_list: List[Dict]) -> List[Dict[str, str]]:
+    """Parse albums from a top albums page, skipping any without essential data."""
+    albums = []
+    for album_data in album_list:
+        artist_data = album_data.get('artist', {})
+        if isinstance(artist_data, dict):
+            artist_name = artist_data.get('name', artist_data.get('#text', ''))
+        else:
+            artist_name = artist_data
+        
+        # Parse the play count once and keep it as an int for the check below
+        playcount = int(album_data.get('playcount') or 0)
+        artist_name = str(artist_name).strip()
+        title = str(album_data.get('name', '')).strip()
+        
+        # Only add if we have essential data
+        if artist_name and title and playcount > 0:
+            albums.append({
+                'artist': artist_name,
+                'title': title,
+                'scrobbles': str(playcount),
+                'mbid': str(album_data.get('mbid', '')).strip()
+            })
+        else:
+            log.debug("Filtered out album: artist=%r, title=%r, scrobbles=%s", artist_name, title, playcount)
+    
+    return albums
+
 def extract_lastfm_albums(username: str, api_key: str, period: str = 'overall', limit: int = 1000, 
                           enrich_with_musicbrainz: bool = False) -> List[Dict[str, str]]:
     """
@@ -114,88 +231,65 @@ def extract_lastfm_albums(username: str, api_key: str, period: str = 'overall',
     """
     # Check cache first
     cache_file = get_cache_filename(username, period, limit, with_musicbrainz=enrich_with_musicbrainz)
-    cached_albums = load_cached_data(cache_file)
-    if cached_albums is not None:
+    cached_albums, cache_is_stale = load_cached_data(cache_file)
+    if cached_albums is not None and not cache_is_stale:
         return cached_albums
     
     albums = []
-    page = 1
-    per_page = 200  # Max allowed per page
+    base_params = {
+        'method': 'user.getTopAlbums',
+        'user': username,
+        'api_key': api_key,
+        'format': 'json',
+        'period': period
+    }
     
     try:
-        while len(albums) < limit:
-            # Calculate how many to fetch this page
-            to_fetch = min(per_page, limit - len(albums))
-            
-            url = "https://ws.audioscrobbler.com/2.0/"
-            params = {
-                'method': 'user.getTopAlbums',
-                'user': username,
-                'api_key': api_key,
-                'format': 'json',
-                'period': period,
-                'limit': to_fetch,
-                'page': page
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Debug: print API URL and response on first page
-            if page == 1:
-                print(f"API URL: {response.url}")
-                print(f"Response keys: {list(data.keys())}")
-                top_albums_debug = data.get('topalbums', {})
-                print(f"Topalbums keys: {list(top_albums_debug.keys())}")
-                if 'album' in top_albums_debug:
-                    print(f"Number of albums in response: {len(top_albums_debug['album']) if isinstance(top_albums_debug['album'], list) else 'Not a list'}")
-                else:
-                    print("No 'album' key in topalbums")
-            
-            # Check for API errors
-            if 'error' in data:
-                print(f"Last.fm API Error {data['error']}: {data['message']}")
-                return []
-            
-            # Extract albums from response
-            top_albums = data.get('topalbums', {})
-            album_list = top_albums.get('album', [])
-            
-            # If no more albums, break
-            if not album_list:
-                break
-            
-            for i, album_data in enumerate(album_list):
-                artist_data = album_data.get('artist', {})
-                if isinstance(artist_data, dict):
-                    artist_name = artist_data.get('name', artist_data.get('#text', ''))
-                else:
-                    artist_name = str(artist_data)
-                
-                album = {
-                    'artist': str(artist_name).strip(),
-                    'title': str(album_data.get('name', '')).strip(),
-                    'scrobbles': str(album_data.get('playcount', '0')),
-                    'mbid': str(album_data.get('mbid', '')).strip()
-                }
-                
-                # Debug: print first album data on first page
-                if page == 1 and i == 0:
-                    print(f"Sample album data: {album_data}")
-                    print(f"Parsed album: {album}")
-                    print(f"Scrobbles check: {album['scrobbles']} > 0 = {int(album['scrobbles']) > 0}")
-                
-                # Only add if we have essential data
-                if album['artist'] and album['title'] and int(album['scrobbles']) > 0:
-                    albums.append(album)
-                elif page == 1 and i < 3:  # Debug first few albums on first page
-                    print(f"Filtered out album {i}: artist='{album['artist']}', title='{album['title']}', scrobbles={album['scrobbles']}")
+        data = fetch_top_albums_page(base_params, 1)
+        
+        # Debug: log the shape of the first page's response
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Response keys: %s", list(data.keys()))
+            top_albums_debug = data.get('topalbums', {})
+            log.debug("Topalbums keys: %s", list(top_albums_debug.keys()))
+            if 'album' in top_albums_debug:
+                log.debug("Number of albums in response: %s", len(top_albums_debug['album']) if isinstance(top_albums_debug['album'], list) else 'Not a list')
+            else:
+                log.debug("No 'album' key in topalbums")
+        
+        # Check for API errors
+        if 'error' in data:
+            print(f"Last.fm API Error {data['error']}: {data['message']}")
+            return []
+        
+        album_list = data.get('topalbums', {}).get('album', [])
+        if album_list:
+            log.debug("Sample album data: %s", album_list[0])
+        
+        total_pages = int(data.get('topalbums', {}).get('@attr', {}).get('totalPages', 1) or 1)
+        pages = [data]
+        next_page = 2
+        
+        with ThreadPoolExecutor(max_workers=LASTFM_PAGE_WORKERS) as executor:
+            while True:
+                # Extract albums from the fetched pages, in page order
+                for page_data in pages:
+                    if 'error' in page_data:
+                        print(f"Last.fm API Error {page_data['error']}: {page_data['message']}")
+                        return []
+                    album_list = page_data.get('topalbums', {}).get('album', [])
+                    albums.extend(parse_album_list(album_list))
                 
-                if len(albums) >= limit:
+                # If no more albums, or enough of them, stop
+                if len(albums) >= limit or next_page > total_pages or not album_list:
                     break
-            
-            page += 1
+                
+                # Fetch the pages still needed at once (some albums may be filtered out,
+                # in which case another round follows)
+                needed = -(-(limit - len(albums)) // LASTFM_PAGE_SIZE)
+                page_numbers = range(next_page, min(next_page + needed, total_pages + 1))
+                pages = list(executor.map(lambda page: fetch_top_albums_page(base_params, page), page_numbers))
+                next_page = page_numbers[-1] + 1
             
         # Enrich with MusicBrainz data if requested
         final_albums = albums[:limit]
@@ -208,12 +302,18 @@ def extract_lastfm_albums(username: str, api_key: str, period: str = 'overall',
         
     except requests.RequestException as e:
         print(f"Error making API request: {e}")
+        # Offline or Last.fm unreachable; stale data is better than none
+        if cached_albums is not None:
+            print("Warning: Using stale cached data instead")
+            return cached_albums
         return []
     except Exception as e:
         print(f"Error processing Last.fm data: {e}")
         return []
 
 def main():
+    configure_logging()
+    
     # Check for API key in environment variable
     api_key = os.getenv('LASTFM_API_KEY')
     
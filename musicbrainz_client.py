@@ -1,76 +1,270 @@
 #!/usr/bin/env python3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
+import sqlite3
 import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from urllib.parse import quote
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 class MusicBrainzClient:
     """
     MusicBrainz API client with rate limiting and caching.
     Respects MusicBrainz's 1 request/second rate limit.
     """
     
-    def __init__(self, cache_dir: str = "data/musicbrainz_cache"):
-        self.base_url = "https://musicbrainz.org/ws/2"
+    # Entries kept in memory on top of the disk cache
+    MEMORY_CACHE_SIZE = 4096
+    
+    # How long cached responses are trusted before being revalidated; release
+    # groups rarely change
+    CACHE_TTL = 30 * 24 * 3600
+    
+    # How long an MBID that returned 404 is remembered as missing
+    NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+    
+    def __init__(self, cache_dir: str = "data/musicbrainz_cache", base_urls: Optional[List[str]] = None):
+        # Requests are spread over the main server and any mirrors given in
+        # MUSICBRAINZ_MIRRORS (comma-separated /ws/2 base URLs); each host is
+        # rate limited separately
+        if base_urls is None:
+            mirrors = os.getenv('MUSICBRAINZ_MIRRORS', '')
+            base_urls = ["https://musicbrainz.org/ws/2"] + [
+                url.strip().rstrip('/') for url in mirrors.split(',') if url.strip()]
+        self.base_urls = base_urls
+        self.base_url = base_urls[0]
         self.cache_dir = cache_dir
-        self.last_request_time = 0
-        self.rate_limit_delay = 1.0  # 1 second between requests
+        self.last_request_times = {url: 0 for url in base_urls}
+        self.rate_limit_delay = 1.05  # Just over 1 second between requests
         
-        # Create cache directory
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db = self._open_cache_db()  # None if unavailable; lookups then skip the disk cache
+        self._mem = OrderedDict()  # LRU of (parsed entry, time stored)
         
         # User agent is required by MusicBrainz
         self.headers = {
             'User-Agent': 'album-finder/1.0 https://github.com/ryebreado/album-finder'
         }
+        
+        # Reuse one connection across requests; retry transient server errors
+        # with backoff. Rate limiting (429/503) is retried by _get instead, so
+        # those retries go through the per-host rate limiter
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=8,
+            max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[500, 502, 504],
+                              respect_retry_after_header=False))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)  # Self-hosted mirrors may not use TLS
+    
+    def _open_cache_db(self) -> Optional[sqlite3.Connection]:
+        """Create the cache directory and open the cache database inside it, or None if that fails."""
+        db = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.cache_dir, 'mb.sqlite'), isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, v BLOB, ts INTEGER, "
+                       "etag TEXT, last_modified TEXT)")
+            columns = {row[1] for row in db.execute("PRAGMA table_info(cache)")}
+            for column in ('etag', 'last_modified'):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE cache ADD COLUMN {column} TEXT")
+            return db
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not open MusicBrainz cache, continuing without it: {e}")
+            if db is not None:
+                db.close()
+            return None
+    
+    def _fetch_row(self, sql: str, params: Tuple) -> Optional[Tuple]:
+        """Run a cache query for one row, treating an unavailable or unreadable database as a miss."""
+        if self.db is None:
+            return None
+        try:
+            return self.db.execute(sql, params).fetchone()
+        except sqlite3.Error:
+            return None
     
     def _get_cache_path(self, cache_key: str) -> str:
-        """Get cache file path for a given key."""
+        """Get the legacy per-key cache file path for a given key."""
         safe_key = cache_key.replace('/', '_').replace('\\', '_')
         return os.path.join(self.cache_dir, f"{safe_key}.json")
     
     def _load_from_cache(self, cache_key: str) -> Optional[Dict]:
-        """Load data from cache if it exists."""
+        """Load data from cache if it exists and hasn't expired."""
+        data, ts = self._read_cache(cache_key)
+        if data is None:
+            return None
+        ttl = self.NEGATIVE_CACHE_TTL if self._is_miss(data) else self.CACHE_TTL
+        if time.time() - ts > ttl:
+            return None
+        return data
+    
+    @staticmethod
+    def _is_miss(data: Optional[Dict]) -> bool:
+        """Check whether a cache entry records a lookup that returned 404."""
+        return bool(data) and data.get('__miss__', False)
+    
+    def _read_cache(self, cache_key: str) -> Tuple[Optional[Dict], int]:
+        """Read a raw cache entry and the time it was stored from memory, the database or a legacy file."""
+        if cache_key in self._mem:
+            self._mem.move_to_end(cache_key)
+            return self._mem[cache_key]
+        
+        row = self._fetch_row("SELECT v, ts FROM cache WHERE k = ?", (cache_key,))
+        if row:
+            try:
+                data = orjson.loads(row[0]) if orjson else json.loads(row[0])
+            except json.JSONDecodeError:
+                return None, 0
+            ts = row[1] or 0
+            self._remember(cache_key, data, ts)
+            return data, ts
+        
+        # Fall back to a file written by older versions, moving it into the database
         cache_path = self._get_cache_path(cache_key)
         if os.path.exists(cache_path):
             try:
+                ts = int(os.path.getmtime(cache_path))
                 with open(cache_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    data = json.load(f)
+                self._save_to_cache(cache_key, data, ts=ts)
+                return data, ts
             except (json.JSONDecodeError, FileNotFoundError):
                 pass
-        return None
+        return None, 0
     
-    def _save_to_cache(self, cache_key: str, data: Dict) -> None:
-        """Save data to cache."""
-        cache_path = self._get_cache_path(cache_key)
+    def _remember(self, cache_key: str, data: Dict, ts: int) -> None:
+        """Add an entry to the in-memory LRU, evicting the oldest if full."""
+        self._mem[cache_key] = (data, ts)
+        self._mem.move_to_end(cache_key)
+        if len(self._mem) > self.MEMORY_CACHE_SIZE:
+            self._mem.popitem(last=False)
+    
+    @staticmethod
+    def _encode(data: Dict) -> bytes:
+        """Serialize a cache entry to compact JSON bytes."""
+        if orjson:
+            return orjson.dumps(data)
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    def _save_to_cache(self, cache_key: str, data: Dict, etag: Optional[str] = None,
+                       last_modified: Optional[str] = None, ts: Optional[int] = None) -> None:
+        """Save data to cache, along with the response validators if known."""
+        if ts is None:
+            ts = int(time.time())
+        self._remember(cache_key, data, ts)
+        if self.db is None:
+            return
         try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
+            self.db.execute("INSERT OR REPLACE INTO cache (k, v, ts, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                            (cache_key, self._encode(data), ts, etag, last_modified))
+        except sqlite3.Error as e:
             print(f"Warning: Could not save to cache: {e}")
     
-    def _rate_limit(self) -> None:
-        """Enforce rate limiting."""
-        elapsed = time.time() - self.last_request_time
+    def _conditional_headers(self, cache_key: str) -> Dict[str, str]:
+        """Headers to revalidate a cached response instead of downloading it again."""
+        row = self._fetch_row("SELECT etag, last_modified FROM cache WHERE k = ?", (cache_key,))
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+    
+    def _next_host(self) -> str:
+        """Pick the base URL whose rate limit window frees up first, waiting for it if needed."""
+        base_url = min(self.base_urls, key=self.last_request_times.__getitem__)
+        elapsed = time.time() - self.last_request_times[base_url]
         if elapsed < self.rate_limit_delay:
             time.sleep(self.rate_limit_delay - elapsed)
-        self.last_request_time = time.time()
+        return base_url
     
-    def _make_request(self, url: str, params: Dict) -> Optional[Dict]:
-        """Make a rate-limited request to MusicBrainz API."""
-        self._rate_limit()
+    # Times a request that was answered with 429/503 is sent again
+    THROTTLE_RETRIES = 3
+    
+    def _get(self, path: str, params: Dict, headers: Dict[str, str]) -> requests.Response:
+        """
+        GET a path from the next free host, retrying when throttled.
         
+        A 429 or 503 holds that host back for its Retry-After, or for a
+        doubling multiple of rate_limit_delay, before it is used again.
+        """
+        for attempt in range(self.THROTTLE_RETRIES + 1):
+            base_url = self._next_host()
+            try:
+                response = self.session.get(f"{base_url}{path}", params=params, headers=headers, timeout=10)
+            finally:
+                # Measure the window from when the response came back, failed or not
+                self.last_request_times[base_url] = time.time()
+            if response.status_code not in (429, 503) or attempt == self.THROTTLE_RETRIES:
+                return response
+            wait = max(self._retry_after(response), self.rate_limit_delay * 2 ** (attempt + 1))
+            self.last_request_times[base_url] += wait - self.rate_limit_delay
+    
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float:
+        """Seconds asked for by a Retry-After header, or 0 if missing or given as a date."""
         try:
-            response = requests.get(url, params=params, headers=self.headers)
+            return float(response.headers.get('Retry-After', 0))
+        except ValueError:
+            return 0.0
+    
+    def _make_request(self, path: str, params: Dict, cache_key: Optional[str] = None) -> Optional[Dict]:
+        """
+        Make a rate-limited request to MusicBrainz API.
+        
+        The path (e.g. "/release-group") is requested from the least recently
+        used host. If cache_key is given, the response is cached under it: a
+        previously stored ETag/Last-Modified is sent so an unchanged entry
+        comes back as a bodyless 304, a 404 is cached as a negative entry so
+        the lookup is skipped on later runs, and if the request fails any
+        expired entry is returned instead.
+        """
+        headers = self._conditional_headers(cache_key) if cache_key else {}
+        
+        try:
+            response = self._get(path, params, headers)
+            if response.status_code == 304:
+                # Unchanged; keep the cached body and restart its age
+                data, _ = self._read_cache(cache_key)
+                now = int(time.time())
+                try:
+                    self.db.execute("UPDATE cache SET ts = ? WHERE k = ?", (now, cache_key))
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not save to cache: {e}")
+                if data is not None:
+                    self._remember(cache_key, data, now)
+                return data
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            if cache_key and data:
+                self._save_to_cache(cache_key, data, response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified'))
+            return data
         except requests.RequestException as e:
+            if cache_key and e.response is not None and e.response.status_code == 404:
+                self._save_to_cache(cache_key, {'__miss__': True, 'ts': time.time()})
+                return None
             # Only print error if it's not a common 404 (which is expected for stale MBIDs)
             if "404" not in str(e):
                 print(f"MusicBrainz API error: {e}")
+            # Couldn't revalidate; an expired entry is still better than none
+            if cache_key:
+                stale, _ = self._read_cache(cache_key)
+                if stale and not self._is_miss(stale):
+                    return stale
             return None
     
     def get_release_group_by_mbid(self, mbid: str) -> Optional[Dict]:
@@ -80,27 +274,95 @@ class MusicBrainzClient:
         
         cache_key = f"rg_{mbid}"
         
-        # Check cache first
+        # Check cache first, including MBIDs recently found to be stale
         cached = self._load_from_cache(cache_key)
+        if self._is_miss(cached):
+            return None
         if cached:
             return cached
         
         # Make API request
-        url = f"{self.base_url}/release-group/{mbid}"
         params = {'fmt': 'json'}
         
-        data = self._make_request(url, params)
-        if data:
-            self._save_to_cache(cache_key, data)
+        return self._make_request(f"/release-group/{mbid}", params, cache_key=cache_key)
+    
+    # Artist/album clauses packed into one batched search request
+    SEARCH_BATCH_SIZE = 25
+    
+    @staticmethod
+    def _search_cache_key(artist: str, album: str) -> str:
+        """Cache key for a search by artist and album name."""
+        return f"search_{artist}_{album}"
+    
+    @staticmethod
+    def _quote_lucene(value: str) -> str:
+        """Quote a value as a Lucene phrase."""
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    
+    def search_release_groups_batch(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        Search for several (artist, album) pairs with a single OR query.
         
-        return data
+        Results are matched back to pairs by exact (case-insensitive) artist
+        and title. Each matched pair is cached like a search_release_groups
+        result; pairs without a match are left out of the returned dict.
+        """
+        pairs = [(artist, album) for artist, album in pairs if artist and album]
+        if not pairs:
+            return {}
+        
+        query = " OR ".join(
+            f'(artist:{self._quote_lucene(artist)} AND releasegroup:{self._quote_lucene(album)})'
+            for artist, album in pairs)
+        
+        params = {
+            'query': query,
+            'limit': 100,
+            'fmt': 'json'
+        }
+        
+        data = self._make_request("/release-group", params)
+        if not data:
+            return {}
+        
+        # Index results by lowercased (artist, title), keeping search order
+        by_key = {}
+        for result in data.get('release-groups', []):
+            credits = result.get('artist-credit') or [{}]
+            key = (credits[0].get('name', '').lower().strip(), result.get('title', '').lower().strip())
+            by_key.setdefault(key, []).append(result)
+        
+        found = {}
+        for artist, album in pairs:
+            results = by_key.get((artist.lower().strip(), album.lower().strip()))
+            if results:
+                self._save_to_cache(self._search_cache_key(artist, album), {'release-groups': results})
+                found[(artist, album)] = results
+        
+        return found
+    
+    def prefetch_searches(self, pairs: List[Tuple[str, str]]) -> int:
+        """
+        Fill the search cache for uncached (artist, album) pairs using batched
+        queries. Pairs that a batch can't resolve are left for
+        search_release_groups to look up one by one.
+        
+        Returns the number of pairs resolved.
+        """
+        uncached = [(artist, album) for artist, album in dict.fromkeys(pairs)
+                    if artist and album and not self._load_from_cache(self._search_cache_key(artist, album))]
+        
+        resolved = 0
+        for start in range(0, len(uncached), self.SEARCH_BATCH_SIZE):
+            resolved += len(self.search_release_groups_batch(uncached[start:start + self.SEARCH_BATCH_SIZE]))
+        return resolved
     
     def search_release_groups(self, artist: str, album: str) -> Optional[List[Dict]]:
         """Search for release groups by artist and album name."""
         if not artist or not album:
             return None
         
-        cache_key = f"search_{artist}_{album}"
+        cache_key = self._search_cache_key(artist, album)
         
         # Check cache first  
         cached = self._load_from_cache(cache_key)
@@ -110,16 +372,14 @@ class MusicBrainzClient:
         # Build search query
         query = f'releasegroup:"{album}" AND artist:"{artist}"'
         
-        url = f"{self.base_url}/release-group"
         params = {
             'query': query,
             'limit': 5,  # Only need top results
             'fmt': 'json'
         }
         
-        data = self._make_request(url, params)
+        data = self._make_request("/release-group", params, cache_key=cache_key)
         if data:
-            self._save_to_cache(cache_key, data)
             results = data.get('release-groups', [])
             
             # Filter results to find best match (prefer exact title matches)
@@ -188,6 +448,45 @@ class MusicBrainzClient:
         if not release_group:
             return None
         
+        return self._release_type_info(release_group, confidence)
+    
+    def get_release_type_cached_only(self, mbid: str = None, artist: str = None, album: str = None) -> Optional[Dict]:
+        """
+        Get release type info for an album from the cache alone.
+        
+        Returns the same as get_release_type would for a cached lookup, or
+        None if answering would need a network request.
+        """
+        release_group = None
+        confidence = 0.0
+        
+        if mbid:
+            release_group = self._load_from_cache(f"rg_{mbid}")
+            confidence = 1.0
+            if self._is_miss(release_group):
+                # Known stale MBID; get_release_type would fall back to search
+                release_group = None
+                if artist and album:
+                    release_group = self._cached_search_result(artist, album)
+                    confidence = 0.7  # Lower confidence for fallback search
+        elif artist and album:
+            release_group = self._cached_search_result(artist, album)
+            confidence = 0.8  # Lower confidence for search results
+        
+        if not release_group:
+            return None
+        
+        return self._release_type_info(release_group, confidence)
+    
+    def _cached_search_result(self, artist: str, album: str) -> Optional[Dict]:
+        """Best cached search result for an artist and album, if any."""
+        cached = self._load_from_cache(self._search_cache_key(artist, album))
+        results = cached.get('release-groups', []) if cached else None
+        return results[0] if results else None
+    
+    @staticmethod
+    def _release_type_info(release_group: Dict, confidence: float) -> Dict:
+        """Summarize a release group into the dict returned by get_release_type."""
         return {
             'primary_type': release_group.get('primary-type'),
             'secondary_types': release_group.get('secondary-types', []),
@@ -1,78 +1,184 @@
 #!/usr/bin/env python3
-import pandas as pd
+import csv
+import json
+import logging
+import os
 import sys
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional
+from cli_logging import configure_logging
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# Columns of the RYM export that extract_rym_data uses (some headers have a leading space)
+RYM_COLUMNS = ['Title', ' First Name', 'Last Name', 'First Name localized',
+               ' Last Name localized', 'Release_Date', 'Rating']
+
+# Columns are read as strings rather than inferred, so a column that is empty
+# or has gaps doesn't come back as floats (e.g. release year "2001.0")
+RYM_DTYPES = {column: str for column in RYM_COLUMNS}
+
+# Extracted albums are cached next to the export as Parquet. The cache records
+# the export's size and modification time along with RYM_CACHE_VERSION and is
+# only reused when all three match; bump the version when extraction changes
+RYM_CACHE_SUFFIX = '.cache.parquet'
+RYM_CACHE_VERSION = 2
+RYM_CACHE_METADATA_KEY = b'album_finder.rym_source'
+RYM_ALBUM_FIELDS = ['title', 'artist', 'artist_localized', 'release_date', 'rating']
+
+def read_rym_csv(csv_file_path: str) -> 'pd.DataFrame':
+    """Read only the used columns of a RYM export, with pyarrow's parser when available."""
+    import pandas as pd
+    
+    try:
+        return pd.read_csv(csv_file_path, usecols=RYM_COLUMNS, dtype=RYM_DTYPES, engine='pyarrow')
+    except ImportError:
+        return pd.read_csv(csv_file_path, usecols=RYM_COLUMNS, dtype=RYM_DTYPES)
+
+def albums_from_columns(columns: List[List[str]]) -> List[Dict[str, str]]:
+    """Zip per-field value lists (in RYM_ALBUM_FIELDS order) into album dicts."""
+    return [dict(zip(RYM_ALBUM_FIELDS, values)) for values in zip(*columns)]
+
+def rym_cache_signature(csv_file_path: str) -> bytes:
+    """Identify an export file, and the extraction logic, a cache was built from."""
+    stat = os.stat(csv_file_path)
+    return json.dumps([RYM_CACHE_VERSION, stat.st_size, stat.st_mtime_ns]).encode('utf-8')
+
+def load_cached_albums(cache_path: str, signature: bytes) -> Optional[List[Dict[str, str]]]:
+    """Return albums from the Parquet cache if it was built from the same export, else None."""
+    try:
+        import pyarrow.parquet as pq
+        
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if metadata.get(RYM_CACHE_METADATA_KEY) != signature:
+            return None
+        table = pq.read_table(cache_path, columns=RYM_ALBUM_FIELDS)
+        return albums_from_columns([table.column(field).to_pylist() for field in RYM_ALBUM_FIELDS])
+    except (OSError, ImportError, ValueError, KeyError):
+        return None
+
+def save_cached_albums(cache_path: str, columns: List[List[str]], signature: bytes) -> None:
+    """Write extracted album columns to the Parquet cache; skipped if pyarrow is not installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return
+    
+    table = pa.table({field: pa.array(values, type=pa.string())
+                      for field, values in zip(RYM_ALBUM_FIELDS, columns)})
+    try:
+        pq.write_table(table.replace_schema_metadata({RYM_CACHE_METADATA_KEY: signature}),
+                       cache_path, compression='zstd')
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: Could not save RYM cache: {e}", file=sys.stderr)
+
+def rym_error_message(csv_file_path: str, error: Exception) -> str:
+    """Describe why reading a RYM export failed."""
+    if isinstance(error, FileNotFoundError):
+        return f"Error: File '{csv_file_path}' not found."
+    return f"Error reading CSV: {error}"
 
 def extract_rym_data(csv_file_path: str) -> List[Dict[str, str]]:
     """
     Extract rated albums from RYM CSV export.
     
     Returns list of albums with title, artist, release_date, and rating.
-    Only includes albums with rating > 0.
+    Only includes albums with rating > 0, one entry per title and artist.
+    Results are cached in a Parquet file next to the CSV and reused until
+    the CSV changes. Errors are printed to stderr and give an empty list.
     """
     try:
-        df = pd.read_csv(csv_file_path)
-        
-        # Debug: print column names
-        print(f"CSV columns: {list(df.columns)}")
-        
-        # Filter out unrated albums (rating 0 or NaN)
-        df = df[df['Rating'] > 0]
-        
-        # Combine First Name and Last Name for artist
-        df['first_name'] = df[' First Name'].fillna('').str.strip()
-        df['last_name'] = df['Last Name'].fillna('').str.strip()
-        df['artist'] = (df['first_name'] + ' ' + df['last_name']).str.strip()
-        
-        # Create localized artist name variant
-        df['first_name_loc'] = df['First Name localized'].fillna('').str.strip()
-        df['last_name_loc'] = df[' Last Name localized'].fillna('').str.strip()
-        df['artist_localized'] = (df['first_name_loc'] + ' ' + df['last_name_loc']).str.strip()
-        
-        # Select and rename columns, including both name variants
-        result_df = df[['Title', 'artist', 'artist_localized', 'Release_Date', 'Rating']].copy()
-        result_df.columns = ['title', 'artist', 'artist_localized', 'release_date', 'rating']
-        
-        # Filter out rows with missing essential data
-        result_df = result_df.dropna(subset=['title', 'artist'])
-        result_df = result_df[(result_df['title'].str.strip() != '') & (result_df['artist'].str.strip() != '')]
-        
-        # Convert to list of dictionaries
-        albums = result_df.to_dict('records')
-        
-        # Convert values to strings and strip whitespace
-        for album in albums:
-            for key, value in album.items():
-                album[key] = str(value).strip() if pd.notna(value) else ''
-        
-        return albums
-        
-    except FileNotFoundError:
-        print(f"Error: File '{csv_file_path}' not found.")
-        return []
+        return load_rym_albums(csv_file_path)
     except Exception as e:
-        print(f"Error reading CSV: {e}")
+        print(rym_error_message(csv_file_path, e), file=sys.stderr)
         return []
 
+def load_rym_albums(csv_file_path: str) -> List[Dict[str, str]]:
+    """Like extract_rym_data, but raises if the export can't be read."""
+    # Check the path before paying for the pandas import
+    if not os.path.isfile(csv_file_path):
+        raise FileNotFoundError(csv_file_path)
+    
+    cache_path = csv_file_path + RYM_CACHE_SUFFIX
+    signature = rym_cache_signature(csv_file_path)
+    cached = load_cached_albums(cache_path, signature)
+    if cached is not None:
+        return cached
+    
+    import pandas as pd
+    
+    df = read_rym_csv(csv_file_path)
+    
+    log.debug("CSV columns: %s", list(df.columns))
+    
+    # Combine First Name and Last Name for artist
+    artist = (df[' First Name'].fillna('').str.strip() + ' ' +
+              df['Last Name'].fillna('').str.strip()).str.strip()
+    
+    # Create localized artist name variant
+    artist_localized = (df['First Name localized'].fillna('').str.strip() + ' ' +
+                        df[' Last Name localized'].fillna('').str.strip()).str.strip()
+    
+    title = df['Title'].fillna('').str.strip()
+    
+    # Keep rated albums (rating > 0) with a title and artist, selecting them in one pass
+    mask = (pd.to_numeric(df['Rating'], errors='coerce') > 0) & (title != '') & (artist != '')
+    
+    # Re-rated albums can appear more than once; keep the first entry per title and artist
+    album_key = title.str.lower() + '\x1f' + artist.str.lower()
+    mask &= ~album_key.where(mask).duplicated()
+    
+    # Build the album dicts straight from the masked columns, including both name variants
+    release_dates = df['Release_Date'][mask].fillna('').str.strip()
+    ratings = df['Rating'][mask].str.strip()
+    columns = [title[mask].tolist(), artist[mask].tolist(), artist_localized[mask].tolist(),
+               release_dates.tolist(), ratings.tolist()]
+    
+    save_cached_albums(cache_path, columns, signature)
+    return albums_from_columns(columns)
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python rym_extractor.py <csv_file_path>")
-        sys.exit(1)
+    configure_logging()
     
-    csv_file = sys.argv[1]
-    albums = extract_rym_data(csv_file)
+    import argparse
     
-    print(f"Extracted {len(albums)} rated albums from RYM data:")
-    print()
+    parser = argparse.ArgumentParser(description='Extract rated albums from a RYM CSV export')
+    parser.add_argument('csv_file', help='Path to RYM CSV export')
+    parser.add_argument('--format', choices=['human', 'json', 'tsv'], default='human',
+                       help='Output format: readable listing (default), a JSON array, or TSV with a header row')
+    args = parser.parse_args()
     
+    try:
+        albums = load_rym_albums(args.csv_file)
+    except Exception as e:
+        print(rym_error_message(args.csv_file, e), file=sys.stderr)
+        sys.exit(1)
+    
+    if args.format == 'json':
+        json.dump(albums, sys.stdout, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return
+    if args.format == 'tsv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=RYM_ALBUM_FIELDS, delimiter='\t', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(albums)
+        return
+    
+    lines = [f"Extracted {len(albums)} rated albums from RYM data:", ""]
     for album in albums:
-        print(f"Title: {album['title']}")
-        print(f"Artist: {album['artist']}")
+        lines.append(f"Title: {album['title']}")
+        lines.append(f"Artist: {album['artist']}")
         if album.get('artist_localized') and album['artist_localized'].strip():
-            print(f"Artist (localized): {album['artist_localized']}")
-        print(f"Release Date: {album['release_date']}")
-        print(f"Rating: {album['rating']}")
-        print("-" * 50)
+            lines.append(f"Artist (localized): {album['artist_localized']}")
+        lines.append(f"Release Date: {album['release_date']}")
+        lines.append(f"Rating: {album['rating']}")
+        lines.append("-" * 50)
+    
+    # Write the listing in one call rather than a print per line
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file